@@ -9,8 +9,286 @@ This script demonstrates catastrophic forgetting by training an MLP on two tasks
 The network will forget how to classify the first task when learning the second task.
 """
 
+import heapq
 import math
 import random
+from array import array
+
+
+class SplittableRandom(random.Random):
+    """random.Random that can split off independent, reproducible child streams
+    
+    Each stream is identified by a key path such as "42/shuffle/0". Seeding from a string
+    hashes it with SHA-512, so a key yields the same sequence in every process.
+    """
+    
+    def __init__(self, key):
+        self.key = str(key)
+        self._spawn_counts = {}
+        super().__init__(self.key)
+    
+    def spawn(self, name):
+        """Split off a child stream; repeated spawns of the same name get distinct streams"""
+        count = self._spawn_counts.get(name, 0)
+        self._spawn_counts[name] = count + 1
+        return SplittableRandom(f"{self.key}/{name}/{count}")
+
+
+class WeightStatsTracker:
+    """Lazily computed norms, drift and update ratios for weight matrices
+    
+    Matrices are indexed [input unit][output unit]; per-unit norms are taken over each
+    unit's incoming weights (a column). Training only marks the statistics dirty; the first
+    query after a change recomputes them in one pass and later queries are O(1), so runs
+    that never query pay nothing.
+    
+    Update ratios need the weights from before each step, so they are only tracked when
+    `track_updates` is enabled; otherwise they read 0.0.
+    
+    The tracker holds references to the matrices it was given. Call resync() after editing
+    weights outside train_step, and create a new tracker for matrices replaced wholesale.
+    """
+    
+    def __init__(self, layers, track_updates=False):
+        self.layers = layers
+        self.track_updates = track_updates
+        self.anchor = None
+        self.dirty = True
+        self.drift_dirty = True
+        self.stats = {}
+        for name in layers:
+            self.stats[name] = {
+                'step_start': None,
+                'update_ratio': 0.0
+            }
+    
+    def resync(self):
+        """Recompute the statistics on the next query, e.g. after editing the weights directly"""
+        self.dirty = True
+        self.drift_dirty = True
+    
+    def _refresh(self):
+        if not self.dirty:
+            return
+        for name, matrix in self.layers.items():
+            unit_norms = [math.hypot(*column) for column in zip(*matrix)]
+            self.stats[name]['unit_norms'] = unit_norms
+            self.stats[name]['norm'] = math.hypot(*unit_norms)
+        self.dirty = False
+    
+    def _refresh_drift(self):
+        if not self.drift_dirty:
+            return
+        for name, matrix in self.layers.items():
+            drift = 0.0
+            if self.anchor is not None:
+                drift = math.hypot(*[math.dist(row, anchor_row) for row, anchor_row in zip(matrix, self.anchor[name])])
+            self.stats[name]['drift'] = drift
+        self.drift_dirty = False
+    
+    def set_anchor(self):
+        """Use the current weights as the reference point for drift (e.g. at a task boundary)"""
+        self.anchor = {name: [row[:] for row in matrix] for name, matrix in self.layers.items()}
+        self.drift_dirty = True
+    
+    def begin_step(self):
+        """Remember the weights at the start of a training step if update ratios are tracked"""
+        if self.track_updates:
+            for name, matrix in self.layers.items():
+                self.stats[name]['step_start'] = [row[:] for row in matrix]
+    
+    def end_step(self):
+        """Mark the statistics dirty and, if tracked, compute each layer's update ratio"""
+        self.resync()
+        if not self.track_updates:
+            return
+        for name, matrix in self.layers.items():
+            layer_stats = self.stats[name]
+            start = layer_stats['step_start']
+            start_norm = math.hypot(*[math.hypot(*row) for row in start])
+            step_norm = math.hypot(*[math.dist(row, start_row) for row, start_row in zip(matrix, start)])
+            layer_stats['step_start'] = None
+            layer_stats['update_ratio'] = step_norm / start_norm if start_norm > 0 else 0.0
+    
+    def norm(self, name):
+        """L2 norm of a layer's weights"""
+        self._refresh()
+        return self.stats[name]['norm']
+    
+    def unit_norm(self, name, unit):
+        """L2 norm of one unit's incoming weights"""
+        self._refresh()
+        return self.stats[name]['unit_norms'][unit]
+    
+    def unit_norms(self, name):
+        """L2 norms of every unit's incoming weights"""
+        self._refresh()
+        return self.stats[name]['unit_norms'][:]
+    
+    def drift(self, name):
+        """L2 distance of a layer's weights from the anchor (0 if no anchor is set)"""
+        self._refresh_drift()
+        return self.stats[name]['drift']
+    
+    def update_ratio(self, name):
+        """Norm of the last step's update relative to the layer norm before that step"""
+        return self.stats[name]['update_ratio']
+
+
+class EpisodicMemory:
+    """Bounded store of labelled hidden representations with a KD-tree for kNN lookups
+    
+    Vectors live in one flat array('d') indexed by slot. Once full, slots are replaced by
+    reservoir sampling so the memory stays a uniform sample of everything offered to it.
+    New vectors are inserted into the tree as leaves and replaced ones are tombstoned; the
+    tree is rebuilt balanced once insertions or tombstones outnumber its balanced size.
+    """
+    DEFAULT_CAPACITY = 256
+    DEFAULT_K = 5
+    NO_NODE = -1
+    
+    def __init__(self, dim, num_classes, capacity=DEFAULT_CAPACITY, k=DEFAULT_K, rng=None):
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        self.dim = dim
+        self.num_classes = num_classes
+        self.capacity = capacity
+        self.k = k
+        self.rng = rng if rng is not None else random.Random()
+        self.clear()
+    
+    def clear(self):
+        """Forget all stored vectors"""
+        self.vectors = array('d')
+        self.labels = array('i')
+        self.slot_node = array('i')
+        self.size = 0
+        self.seen = 0
+        self._reset_tree()
+    
+    def _reset_tree(self):
+        self.node_slot = array('i')
+        self.node_axis = array('i')
+        self.node_split = array('d')  # Copied so tombstoned nodes keep splitting after their slot is reused
+        self.node_left = array('i')
+        self.node_right = array('i')
+        self.node_alive = array('b')
+        self.root = self.NO_NODE
+        self.dead_nodes = 0
+        self.balanced_size = 0
+    
+    def _new_node(self, slot, axis):
+        node = len(self.node_slot)
+        self.node_slot.append(slot)
+        self.node_axis.append(axis)
+        self.node_split.append(self.vectors[slot * self.dim + axis])
+        self.node_left.append(self.NO_NODE)
+        self.node_right.append(self.NO_NODE)
+        self.node_alive.append(1)
+        self.slot_node[slot] = node
+        return node
+    
+    def add(self, vector, label):
+        """Offer a vector to the memory; returns False if reservoir sampling discarded it"""
+        if len(vector) != self.dim:
+            raise ValueError(f"Expected a vector of length {self.dim}, got {len(vector)}")
+        if not 0 <= label < self.num_classes:
+            raise ValueError(f"Label must be in range({self.num_classes}), got {label}")
+        self.seen += 1
+        if self.size < self.capacity:
+            slot = self.size
+            self.vectors.extend(vector)
+            self.labels.append(label)
+            self.slot_node.append(self.NO_NODE)
+            self.size += 1
+        else:
+            slot = self.rng.randrange(self.seen)
+            if slot >= self.capacity:
+                return False
+            start = slot * self.dim
+            self.vectors[start:start + self.dim] = array('d', vector)
+            self.labels[slot] = label
+            self.node_alive[self.slot_node[slot]] = 0
+            self.dead_nodes += 1
+        
+        self._insert(slot)
+        inserted = len(self.node_slot) - self.balanced_size
+        if inserted > self.balanced_size or self.dead_nodes > self.size:
+            self.rebuild()
+        return True
+    
+    def _insert(self, slot):
+        """Descend to a leaf and hang the slot's point below it"""
+        if self.root == self.NO_NODE:
+            self.root = self._new_node(slot, 0)
+            return
+        
+        start = slot * self.dim
+        node = self.root
+        while True:
+            axis = self.node_axis[node]
+            children = self.node_left if self.vectors[start + axis] < self.node_split[node] else self.node_right
+            if children[node] == self.NO_NODE:
+                children[node] = self._new_node(slot, (axis + 1) % self.dim)
+                return
+            node = children[node]
+    
+    def rebuild(self):
+        """Rebuild a balanced tree over the live slots"""
+        self._reset_tree()
+        self.root = self._build(list(range(self.size)), 0)
+        self.balanced_size = self.size
+    
+    def _build(self, slots, depth):
+        if not slots:
+            return self.NO_NODE
+        axis = depth % self.dim
+        slots.sort(key=lambda slot: self.vectors[slot * self.dim + axis])
+        median = len(slots) // 2
+        node = self._new_node(slots[median], axis)
+        self.node_left[node] = self._build(slots[:median], depth + 1)
+        self.node_right[node] = self._build(slots[median + 1:], depth + 1)
+        return node
+    
+    def nearest(self, vector, k=None):
+        """Find the k nearest stored vectors as (squared distance, slot) pairs, closest first"""
+        k = self.k if k is None else k
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        best = []  # Max-heap of (-squared distance, slot)
+        stack = [(self.root, 0.0)]  # (node, lower bound on squared distance to its subtree)
+        
+        while stack:
+            node, bound_sq = stack.pop()
+            if node == self.NO_NODE or (len(best) == k and bound_sq >= -best[0][0]):
+                continue
+            
+            if self.node_alive[node]:
+                start = self.node_slot[node] * self.dim
+                dist_sq = 0.0
+                for d in range(self.dim):
+                    diff = vector[d] - self.vectors[start + d]
+                    dist_sq += diff * diff
+                if len(best) < k:
+                    heapq.heappush(best, (-dist_sq, self.node_slot[node]))
+                elif dist_sq < -best[0][0]:
+                    heapq.heapreplace(best, (-dist_sq, self.node_slot[node]))
+            
+            # Push the far side first so the near side is searched first and tightens the bound
+            gap = vector[self.node_axis[node]] - self.node_split[node]
+            near, far = (self.node_left, self.node_right) if gap < 0 else (self.node_right, self.node_left)
+            stack.append((far[node], max(bound_sq, gap * gap)))
+            stack.append((near[node], bound_sq))
+        
+        return sorted((-neg_dist_sq, slot) for neg_dist_sq, slot in best)
+    
+    def vote(self, vector, k=None):
+        """Class distribution over the labels of the k nearest stored vectors"""
+        votes = [0.0] * self.num_classes
+        neighbors = self.nearest(vector, k)
+        for _, slot in neighbors:
+            votes[self.labels[slot]] += 1
+        return [v / len(neighbors) for v in votes] if neighbors else votes
 
 
 class MLP4ClassClassifier:
@@ -26,34 +304,62 @@ class MLP4ClassClassifier:
     Z_CLAMP_MAX = 500
     WEIGHT_SAVE_INTERVAL = 5
     PRINT_INTERVAL = 10
+    SEED_BITS = 64
+    DEFAULT_MEMORY_BLEND = 0.5
     
-    def __init__(self, learning_rate=DEFAULT_LEARNING_RATE, hidden_size=DEFAULT_HIDDEN_SIZE):
+    def __init__(self, learning_rate=DEFAULT_LEARNING_RATE, hidden_size=DEFAULT_HIDDEN_SIZE, seed=None, rng=None):
         self.learning_rate = learning_rate
         self.hidden_size = hidden_size
         self.num_classes = self.NUM_CLASSES
         
+        # Every model owns its random streams so concurrent runs never share state.
+        # Without an explicit seed one is drawn from `rng` (or the global module) and
+        # recorded, so any run can be reproduced from `model.seed`.
+        if seed is not None and rng is not None:
+            raise ValueError("Pass either seed or rng, not both")
+        if seed is None:
+            seed = (rng if rng is not None else random).getrandbits(self.SEED_BITS)
+        self.seed = seed
+        self.rng = SplittableRandom(seed)
+        self.init_rng = self.spawn_rng('init')
+        
         # Initialize weights with small random values
         self.weights1 = self._initialize_weights(self.INPUT_SIZE, hidden_size)  # Input to hidden
-        self.bias1 = [random.uniform(-self.BIAS_INIT_RANGE, self.BIAS_INIT_RANGE) for _ in range(hidden_size)]
+        self.bias1 = self._initialize_biases(hidden_size)
         
         self.weights2 = self._initialize_weights(hidden_size, self.num_classes)  # Hidden to output
-        self.bias2 = [random.uniform(-self.BIAS_INIT_RANGE, self.BIAS_INIT_RANGE) for _ in range(self.num_classes)]
+        self.bias2 = self._initialize_biases(self.num_classes)
         
         self.epoch = 0
         self.loss_history = []
         self.accuracy_history = []
         self.weight_history = []
+        self.weight_stats = WeightStatsTracker({'hidden': self.weights1, 'output': self.weights2})
+        self.memory = None
+        self.memory_blend = 0.0
         
         # Store initial weights
         self._save_weight_snapshot()
     
+    def spawn_rng(self, stream):
+        """Split an independent random stream (e.g. 'init', 'shuffle', 'replay') off the model seed
+        
+        The n-th spawn of a name always gets the same stream, so runs replay exactly as long as
+        streams are spawned in the same order. The result can be split further with spawn().
+        """
+        return self.rng.spawn(stream)
+    
     def _initialize_weights(self, input_size, output_size):
         """Initialize weights with small random values"""
         weights = []
         for i in range(input_size):
-            weights.append([random.uniform(-self.WEIGHT_INIT_RANGE, self.WEIGHT_INIT_RANGE) for _ in range(output_size)])
+            weights.append([self.init_rng.uniform(-self.WEIGHT_INIT_RANGE, self.WEIGHT_INIT_RANGE) for _ in range(output_size)])
         return weights
     
+    def _initialize_biases(self, size):
+        """Initialize biases with small random values"""
+        return [self.init_rng.uniform(-self.BIAS_INIT_RANGE, self.BIAS_INIT_RANGE) for _ in range(size)]
+    
     def _save_weight_snapshot(self):
         """Save current weights for history tracking"""
         self.weight_history.append({
@@ -98,9 +404,26 @@ class MLP4ClassClassifier:
         
         return {'hidden': hidden, 'logits': logits, 'output': output}
     
+    def attach_memory(self, capacity=EpisodicMemory.DEFAULT_CAPACITY, k=EpisodicMemory.DEFAULT_K, blend=DEFAULT_MEMORY_BLEND):
+        """Attach an episodic memory of hidden representations whose kNN votes are blended into predict()"""
+        self.memory = EpisodicMemory(self.hidden_size, self.num_classes, capacity, k, rng=self.spawn_rng('memory'))
+        self.memory_blend = blend
+        return self.memory
+    
+    def remember(self, dataset):
+        """Store the current hidden representations of dataset samples in the attached memory"""
+        if self.memory is None:
+            raise RuntimeError("No memory attached; call attach_memory() before remember()")
+        for x, y in dataset:
+            self.memory.add(self.forward(x)['hidden'], y)
+    
     def predict(self, x):
         """Get prediction probabilities for input x"""
-        return self.forward(x)['output']
+        result = self.forward(x)
+        if self.memory is None or self.memory.size == 0:
+            return result['output']
+        votes = self.memory.vote(result['hidden'])
+        return [(1 - self.memory_blend) * p + self.memory_blend * v for p, v in zip(result['output'], votes)]
     
     def predict_class(self, x):
         """Get predicted class for input x"""
@@ -111,6 +434,7 @@ class MLP4ClassClassifier:
         """Perform one training step on the dataset"""
         total_loss = 0
         correct = 0
+        self.weight_stats.begin_step()
         
         for x, y in dataset:
             # Forward pass
@@ -122,7 +446,8 @@ class MLP4ClassClassifier:
             loss = -math.log(output[y] + self.EPSILON)  # Add small epsilon to prevent log(0)
             total_loss += loss
             
-            if self.predict_class(x) == y:
+            # Memory blending is inference-only; score the same softmax the loss uses
+            if output.index(max(output)) == y:
                 correct += 1
             
             # Backward pass
@@ -151,6 +476,7 @@ class MLP4ClassClassifier:
             for j in range(self.hidden_size):
                 self.bias1[j] -= self.learning_rate * hidden_errors[j]
         
+        self.weight_stats.end_step()
         self.epoch += 1
         avg_loss = total_loss / len(dataset)
         accuracy = correct / len(dataset)
@@ -180,7 +506,7 @@ class MLP4ClassClassifier:
         
         for x, y in dataset:
             predictions = self.predict(x)
-            predicted_class = self.predict_class(x)
+            predicted_class = predictions.index(max(predictions))
             
             if predicted_class == y:
                 correct += 1
@@ -194,32 +520,41 @@ class MLP4ClassClassifier:
         return {'accuracy': accuracy, 'loss': avg_loss}
     
     def get_weight_magnitudes(self):
-        """Calculate L2 norm of weight matrices"""
-        w1_mag = 0
-        for i in range(len(self.weights1)):
-            for j in range(len(self.weights1[i])):
-                w1_mag += self.weights1[i][j] ** 2
-        w1_mag = math.sqrt(w1_mag)
-        
-        w2_mag = 0
-        for j in range(len(self.weights2)):
-            for k in range(len(self.weights2[j])):
-                w2_mag += self.weights2[j][k] ** 2
-        w2_mag = math.sqrt(w2_mag)
+        """Calculate L2 norm of weight matrices
         
-        return {'hidden': w1_mag, 'output': w2_mag}
+        Norms are recomputed at most once per train_step, on the first query. After editing
+        weights directly, call weight_stats.resync() first; after replacing the matrices,
+        create a new weight_stats tracker.
+        """
+        return {'hidden': self.weight_stats.norm('hidden'), 'output': self.weight_stats.norm('output')}
+    
+    def set_task_anchor(self):
+        """Record the current weights as the reference for get_weight_drift()"""
+        self.weight_stats.set_anchor()
+    
+    def get_weight_drift(self):
+        """Calculate L2 distance of weight matrices from the task anchor"""
+        return {'hidden': self.weight_stats.drift('hidden'), 'output': self.weight_stats.drift('output')}
+    
+    def get_update_ratios(self):
+        """Get each layer's last update norm relative to its weight norm (needs weight_stats.track_updates)"""
+        return {'hidden': self.weight_stats.update_ratio('hidden'), 'output': self.weight_stats.update_ratio('output')}
     
     def reset(self):
         """Reset the network to initial random weights"""
         self.weights1 = self._initialize_weights(self.INPUT_SIZE, self.hidden_size)
-        self.bias1 = [random.uniform(-self.BIAS_INIT_RANGE, self.BIAS_INIT_RANGE) for _ in range(self.hidden_size)]
+        self.bias1 = self._initialize_biases(self.hidden_size)
         self.weights2 = self._initialize_weights(self.hidden_size, self.num_classes)
-        self.bias2 = [random.uniform(-self.BIAS_INIT_RANGE, self.BIAS_INIT_RANGE) for _ in range(self.num_classes)]
+        self.bias2 = self._initialize_biases(self.num_classes)
         
         self.epoch = 0
         self.loss_history = []
         self.accuracy_history = []
         self.weight_history = []
+        self.weight_stats = WeightStatsTracker({'hidden': self.weights1, 'output': self.weights2},
+                                               track_updates=self.weight_stats.track_updates)
+        if self.memory is not None:
+            self.memory.clear()  # Stored representations belong to the old weights
         
         self._save_weight_snapshot()
 
@@ -3,7 +3,11 @@
 Basic tests for the MLP 4-class classifier
 """
 
+import math
+import random
+
 from mlp_4class_forgetting import (
+    EpisodicMemory,
     MLP4ClassClassifier,
     generate_task1_dataset,
     generate_task2_dataset,
@@ -140,6 +144,224 @@ def test_weight_magnitudes():
     print("✓ Weight magnitude test passed")
 
 
+def test_seeded_reproducibility():
+    """Test that a seed reproduces a run regardless of global random state"""
+    TEST_SEED = 1234
+    TEST_EPOCHS = 5
+    task1_data = generate_task1_dataset()
+    
+    model_a = MLP4ClassClassifier(seed=TEST_SEED)
+    random.random()  # Global draws must not leak into per-model streams
+    model_b = MLP4ClassClassifier(seed=TEST_SEED)
+    assert model_a.weights1 == model_b.weights1
+    assert model_a.bias2 == model_b.bias2
+    
+    model_a.train(task1_data, epochs=TEST_EPOCHS, show_progress=False)
+    model_b.train(task1_data, epochs=TEST_EPOCHS, show_progress=False)
+    assert model_a.loss_history == model_b.loss_history
+    
+    # Reset draws fresh weights, but from the same seeded init stream
+    model_a.reset()
+    model_b.reset()
+    assert model_a.weights2 == model_b.weights2
+    
+    # Unseeded models record the seed they drew, so they can be replayed
+    model_c = MLP4ClassClassifier()
+    model_d = MLP4ClassClassifier(seed=model_c.seed)
+    assert model_c.weights1 == model_d.weights1
+    
+    # Injected generators determine the seed
+    model_e = MLP4ClassClassifier(rng=random.Random(TEST_SEED))
+    model_f = MLP4ClassClassifier(rng=random.Random(TEST_SEED))
+    assert model_e.seed == model_f.seed
+    
+    # Child streams are independent of each other but reproducible
+    shuffle_a = model_a.spawn_rng('shuffle')
+    shuffle_b = model_b.spawn_rng('shuffle')
+    assert shuffle_a.random() == shuffle_b.random()
+    assert model_a.spawn_rng('shuffle').random() != model_a.spawn_rng('replay').random()
+    
+    # Repeated spawns of a name differ, and children split further reproducibly
+    assert model_a.spawn_rng('epoch').random() != model_a.spawn_rng('epoch').random()
+    assert shuffle_a.spawn('worker').random() == shuffle_b.spawn('worker').random()
+    assert shuffle_a.spawn('worker').random() != shuffle_a.spawn('worker').random()
+    
+    try:
+        MLP4ClassClassifier(seed=TEST_SEED, rng=random.Random(TEST_SEED))
+    except ValueError:
+        pass
+    else:
+        assert False, "Expected ValueError when passing both seed and rng"
+    
+    print("✓ Seeded reproducibility test passed")
+
+
+def test_weight_stats_tracking():
+    """Test that incremental weight statistics match a full recomputation"""
+    TOLERANCE = 1e-9
+    TEST_EPOCHS = 7
+    model = MLP4ClassClassifier(seed=7)
+    task1_data = generate_task1_dataset()
+    task2_data = generate_task2_dataset()
+    
+    model.train(task1_data, epochs=TEST_EPOCHS, show_progress=False)
+    anchor1 = [row[:] for row in model.weights1]
+    model.set_task_anchor()
+    
+    model.train(task2_data, epochs=TEST_EPOCHS, show_progress=False)
+    
+    expected_hidden = math.sqrt(sum(w ** 2 for row in model.weights1 for w in row))
+    expected_output = math.sqrt(sum(w ** 2 for row in model.weights2 for w in row))
+    mags = model.get_weight_magnitudes()
+    assert abs(mags['hidden'] - expected_hidden) < TOLERANCE
+    assert abs(mags['output'] - expected_output) < TOLERANCE
+    
+    unit_norms = model.weight_stats.unit_norms('hidden')
+    assert len(unit_norms) == MLP4ClassClassifier.DEFAULT_HIDDEN_SIZE
+    for j, unit_norm in enumerate(unit_norms):
+        expected = math.sqrt(sum(row[j] ** 2 for row in model.weights1))
+        assert abs(unit_norm - expected) < TOLERANCE
+    
+    expected_drift = math.sqrt(sum(
+        (model.weights1[i][j] - anchor1[i][j]) ** 2
+        for i in range(len(anchor1)) for j in range(len(anchor1[i]))
+    ))
+    assert abs(model.get_weight_drift()['hidden'] - expected_drift) < TOLERANCE
+    
+    # Update ratios are opt-in and cover the last step only
+    assert model.get_update_ratios()['output'] == 0.0
+    model.weight_stats.track_updates = True
+    before2 = [row[:] for row in model.weights2]
+    model.train_step(task2_data)
+    step_norm = math.sqrt(sum(
+        (model.weights2[j][k] - before2[j][k]) ** 2
+        for j in range(len(before2)) for k in range(len(before2[j]))
+    ))
+    before_norm = math.sqrt(sum(w ** 2 for row in before2 for w in row))
+    assert abs(model.get_update_ratios()['output'] - step_norm / before_norm) < TOLERANCE
+    
+    # Direct edits are picked up after resync()
+    model.weights1[0][0] += 1.0
+    model.weight_stats.resync()
+    expected_hidden = math.sqrt(sum(w ** 2 for row in model.weights1 for w in row))
+    assert abs(model.get_weight_magnitudes()['hidden'] - expected_hidden) < TOLERANCE
+    
+    print("✓ Weight stats tracking test passed")
+
+
+def test_episodic_memory():
+    """Test that memory lookups match a brute-force scan and capacity is respected"""
+    DIM = 4
+    CAPACITY = 200
+    NUM_VECTORS = 500
+    NUM_QUERIES = 50
+    K = 5
+    rng = random.Random(3)
+    memory = EpisodicMemory(DIM, MLP4ClassClassifier.NUM_CLASSES, capacity=CAPACITY, k=K, rng=random.Random(4))
+    
+    for _ in range(NUM_VECTORS):
+        memory.add([rng.random() for _ in range(DIM)], rng.randrange(MLP4ClassClassifier.NUM_CLASSES))
+    assert memory.size == CAPACITY
+    assert len(memory.vectors) == CAPACITY * DIM
+    
+    # Reservoir replacement leaves tombstones; lookups must still be exact
+    for _ in range(NUM_QUERIES):
+        query = [rng.random() for _ in range(DIM)]
+        brute_force = sorted(
+            (sum((query[d] - memory.vectors[slot * DIM + d]) ** 2 for d in range(DIM)), slot)
+            for slot in range(memory.size)
+        )[:K]
+        assert [slot for _, slot in memory.nearest(query)] == [slot for _, slot in brute_force]
+    
+    votes = memory.vote([rng.random() for _ in range(DIM)])
+    assert abs(sum(votes) - 1.0) < 1e-10
+    
+    # Invalid k and mis-sized vectors are rejected instead of corrupting the flat storage
+    for bad_call in (
+        lambda: memory.nearest([0.0] * DIM, k=0),
+        lambda: memory.add([0.0] * (DIM + 1), 0),
+        lambda: memory.add([0.0] * DIM, -1),
+        lambda: memory.add([0.0] * DIM, MLP4ClassClassifier.NUM_CLASSES),
+        lambda: EpisodicMemory(DIM, MLP4ClassClassifier.NUM_CLASSES, k=0),
+    ):
+        try:
+            bad_call()
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected ValueError"
+    assert len(memory.vectors) == CAPACITY * DIM
+    
+    print("✓ Episodic memory test passed")
+
+
+def test_memory_augmented_prediction():
+    """Test that attached memory blends kNN votes into predictions"""
+    TEST_EPOCHS = 50
+    model = MLP4ClassClassifier(seed=11)
+    task1_data = generate_task1_dataset()
+    
+    try:
+        model.remember(task1_data)
+    except RuntimeError:
+        pass
+    else:
+        assert False, "Expected RuntimeError without an attached memory"
+    
+    model.train(task1_data, epochs=TEST_EPOCHS, show_progress=False)
+    memory = model.attach_memory(blend=1.0)
+    model.remember(task1_data)
+    assert memory.size == len(task1_data)
+    
+    # With full blend, a stored sample's prediction is its neighbors' vote
+    x, y = task1_data[0]
+    predictions = model.predict(x)
+    assert abs(sum(predictions) - 1.0) < 1e-10
+    assert predictions == memory.vote(model.forward(x)['hidden'])
+    
+    # Evaluation does one memory lookup per sample
+    lookups = []
+    nearest = memory.nearest
+    memory.nearest = lambda vector, k=None: lookups.append(vector) or nearest(vector, k)
+    model.evaluate(task1_data)
+    assert len(lookups) == len(task1_data)
+    del memory.nearest
+    
+    model.memory_blend = 0.0
+    assert model.predict(x) == model.forward(x)['output']
+    
+    model.reset()
+    assert memory.size == 0
+    assert model.predict(x) == model.forward(x)['output']
+    
+    print("✓ Memory-augmented prediction test passed")
+
+
+def test_training_accuracy_ignores_memory():
+    """Test that training accuracy scores the raw softmax even with a memory attached"""
+    TEST_EPOCHS = 60
+    model = MLP4ClassClassifier(seed=5)
+    task1_data = generate_task1_dataset()
+    task2_data = generate_task2_dataset()
+    
+    model.train(task1_data, epochs=TEST_EPOCHS, show_progress=False)
+    model.attach_memory(blend=0.5)
+    model.remember(task1_data)
+    model.train(task2_data, epochs=TEST_EPOCHS, show_progress=False)
+    
+    # Freeze the weights so the reported step and the raw softmax see the same model
+    model.learning_rate = 0.0
+    metrics = model.train_step(task2_data)
+    raw_correct = 0
+    for x, y in task2_data:
+        output = model.forward(x)['output']
+        if output.index(max(output)) == y:
+            raw_correct += 1
+    assert metrics['accuracy'] == raw_correct / len(task2_data)
+    
+    print("✓ Training accuracy with memory test passed")
+
+
 def run_all_tests():
     """Run all tests"""
     print("Running MLP 4-class classifier tests...")
@@ -152,6 +374,11 @@ def run_all_tests():
     test_training()
     test_evaluation()
     test_weight_magnitudes()
+    test_seeded_reproducibility()
+    test_weight_stats_tracking()
+    test_episodic_memory()
+    test_memory_augmented_prediction()
+    test_training_accuracy_ignores_memory()
     
     print()
     print("🎉 All tests passed!")